@@ -1,10 +1,12 @@
 import asyncio
 
+from aiohttp.web import HTTPException
+
 from ..asyncio import context_provider
 from ...compat import stringify
 from ...constants import ANALYTICS_SAMPLE_RATE_KEY, SPAN_MEASURED_KEY
 from ...ext import SpanTypes, http
-from ...propagation.http import HTTPPropagator
+from ...propagation.http import HTTPPropagator, POSSIBLE_HTTP_HEADER_TRACE_IDS
 from ...settings import config
 
 
@@ -12,6 +14,17 @@ CONFIG_KEY = 'datadog_trace'
 REQUEST_CONTEXT_KEY = 'datadog_context'
 REQUEST_CONFIG_KEY = '__datadog_trace_config'
 REQUEST_SPAN_KEY = '__datadog_request_span'
+REQUEST_STATUS_KEY = '__datadog_response_status'
+
+# tag names and span types used on every request
+_SPAN_TYPE_WEB = SpanTypes.WEB
+_METHOD_TAG = http.METHOD
+_STATUS_CODE_TAG = http.STATUS_CODE
+_URL_TAG = http.URL
+_QUERY_STRING_TAG = http.QUERY_STRING
+
+# the propagator is stateless, so a single instance is shared by all requests
+propagator = HTTPPropagator()
 
 
 @asyncio.coroutine
@@ -27,14 +40,17 @@ def trace_middleware(app, handler):
     @asyncio.coroutine
     def attach_context(request):
         # application configs
-        tracer = app[CONFIG_KEY]['tracer']
-        service = app[CONFIG_KEY]['service']
-        distributed_tracing = app[CONFIG_KEY]['distributed_tracing_enabled']
+        trace_config = app[CONFIG_KEY]
+        tracer = trace_config['tracer']
+        service = trace_config['service']
+        distributed_tracing = trace_config['distributed_tracing_enabled']
 
         # Create a new context based on the propagated information.
-        if distributed_tracing:
-            propagator = HTTPPropagator()
-            context = propagator.extract(request.headers)
+        # DEV: ``request.headers`` is case-insensitive; without a trace id the extracted
+        # context is never activated, so we avoid parsing the headers altogether
+        headers = request.headers
+        if distributed_tracing and any(header in headers for header in POSSIBLE_HTTP_HEADER_TRACE_IDS):
+            context = propagator.extract(headers)
             # Only need to active the new context if something was propagated
             if context.trace_id:
                 tracer.context_provider.activate(context)
@@ -43,46 +59,88 @@ def trace_middleware(app, handler):
         request_span = tracer.trace(
             'aiohttp.request',
             service=service,
-            span_type=SpanTypes.WEB,
+            span_type=_SPAN_TYPE_WEB,
         )
         request_span.set_tag(SPAN_MEASURED_KEY)
 
         # Configure trace search sample rate
         # DEV: aiohttp is special case maintains separate configuration from config api
-        analytics_enabled = app[CONFIG_KEY]['analytics_enabled']
+        analytics_enabled = trace_config['analytics_enabled']
         if (config.analytics_enabled and analytics_enabled is not False) or analytics_enabled is True:
             request_span.set_tag(
                 ANALYTICS_SAMPLE_RATE_KEY,
-                app[CONFIG_KEY].get('analytics_sample_rate', True)
+                trace_config.get('analytics_sample_rate', True)
             )
 
         # attach the context and the root span to the request; the Context
         # may be freely used by the application code
         request[REQUEST_CONTEXT_KEY] = request_span.context
         request[REQUEST_SPAN_KEY] = request_span
-        request[REQUEST_CONFIG_KEY] = app[CONFIG_KEY]
+        status = None
+        finish = True
         try:
             response = yield from handler(request)
+            if response.prepared:
+                # the handler streamed the response, its status is already sent
+                status = response.status
+            else:
+                # DEV: the status is final only once the response is prepared (e.g. a
+                # ``FileResponse`` may send a 304), so ``on_prepare`` closes the span
+                request[REQUEST_CONFIG_KEY] = trace_config
+                finish = False
             return response
+        except asyncio.CancelledError:
+            # DEV: aiohttp does not send any response for a cancelled handler (e.g.
+            # client disconnection); it is an ``Exception`` before Python 3.8
+            raise
+        except HTTPException as exc:
+            # web exceptions are rendered as the response, unless the handler
+            # already sent one
+            if REQUEST_STATUS_KEY in request:
+                request_span.set_traceback()
+            status = exc.status
+            raise
         except Exception:
+            # any other exception is turned into an internal server error by aiohttp
             request_span.set_traceback()
+            status = 500
             raise
+        finally:
+            if finish:
+                # a status already sent to the client can't be changed anymore
+                sent_status = request.get(REQUEST_STATUS_KEY)
+                if sent_status is not None:
+                    status = sent_status
+                _finish_request_span(request_span, request, status, trace_config)
     return attach_context
 
 
 @asyncio.coroutine
 def on_prepare(request, response):
     """
-    The on_prepare signal is used to close the request span that is created during
-    the trace middleware execution.
+    The on_prepare signal is used to close the request span once the handler
+    returned, or to keep track of the status sent while the handler is running.
     """
     # safe-guard: discard if we don't have a request span
     request_span = request.get(REQUEST_SPAN_KEY, None)
     if not request_span:
         return
 
+    trace_config = request.get(REQUEST_CONFIG_KEY, None)
+    if trace_config is None:
+        # the span is closed by the middleware
+        request[REQUEST_STATUS_KEY] = response.status
+        return
+    _finish_request_span(request_span, request, response.status, trace_config)
+
+
+def _finish_request_span(request_span, request, status, trace_config):
+    """
+    Tag the request span with the response information and close it. The ``status``
+    is ``None`` when the request was interrupted before any response was sent.
+    """
     # default resource name
-    resource = stringify(response.status)
+    resource = stringify(status) if status is not None else None
 
     if request.match_info.route.resource:
         # collect the resource name based on http resource type
@@ -96,21 +154,22 @@ def on_prepare(request, response):
             resource = res_info.get('prefix')
 
         # prefix the resource name by the http method
-        resource = '{} {}'.format(request.method, resource)
-
-    if 500 <= response.status < 600:
-        request_span.error = 1
-
-    request_span.resource = resource
-    request_span.set_tag('http.method', request.method)
-    request_span.set_tag('http.status_code', response.status)
-    request_span.set_tag(http.URL, request.url.with_query(None))
+        resource = '%s %s' % (request.method, resource)
+
+    if resource is not None:
+        request_span.resource = resource
+    request_span.set_tag(_METHOD_TAG, request.method)
+    if status is not None:
+        if 500 <= status < 600:
+            request_span.error = 1
+        request_span.set_tag(_STATUS_CODE_TAG, status)
+    request_span.set_tag(_URL_TAG, request.url.with_query(None))
     # DEV: aiohttp is special case maintains separate configuration from config api
-    trace_query_string = request[REQUEST_CONFIG_KEY].get('trace_query_string')
+    trace_query_string = trace_config.get('trace_query_string')
     if trace_query_string is None:
         trace_query_string = config._http.trace_query_string
     if trace_query_string:
-        request_span.set_tag(http.QUERY_STRING, request.query_string)
+        request_span.set_tag(_QUERY_STRING_TAG, request.query_string)
     request_span.finish()
 
 
@@ -141,7 +200,7 @@ def trace_app(app, tracer, service='aiohttp-web'):
     # the tracer must work with asynchronous Context propagation
     tracer.configure(context_provider=context_provider)
 
-    # add the async tracer middleware as a first middleware
-    # and be sure that the on_prepare signal is the last one
+    # add the async tracer middleware as a first middleware so that
+    # the request span covers the execution of any other middleware
     app.middlewares.insert(0, trace_middleware)
     app.on_response_prepare.append(on_prepare)
@@ -5,13 +5,17 @@ from ddtrace import Pin
 from ...ext import SpanTypes
 
 
+_SPAN_TYPE_TEMPLATE = SpanTypes.TEMPLATE
+
+
 def _trace_render_template(func, module, args, kwargs):
     """
     Trace the template rendering
     """
     # get the module pin
     pin = Pin.get_from(aiohttp_jinja2)
-    if not pin or not pin.enabled():
+    tracer = pin.tracer if pin else None
+    if not tracer or not tracer.enabled:
         return func(*args, **kwargs)
 
     # original signature:
@@ -22,8 +26,8 @@ def _trace_render_template(func, module, args, kwargs):
 
     # the prefix is available only on PackageLoader
     template_prefix = getattr(env.loader, 'package_path', '')
-    template_meta = '{}/{}'.format(template_prefix, template_name)
+    template_meta = '%s/%s' % (template_prefix, template_name)
 
-    with pin.tracer.trace('aiohttp.template', span_type=SpanTypes.TEMPLATE) as span:
+    with tracer.trace('aiohttp.template', span_type=_SPAN_TYPE_TEMPLATE) as span:
         span.set_meta('aiohttp.template', template_meta)
         return func(*args, **kwargs)
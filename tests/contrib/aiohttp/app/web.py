@@ -71,6 +71,30 @@ def caught_server_error(request):
     return web.Response(text='NOT OK', status=503)
 
 
+@asyncio.coroutine
+def forbidden(request):
+    raise web.HTTPForbidden()
+
+
+@asyncio.coroutine
+def redirect(request):
+    raise web.HTTPFound('/')
+
+
+@asyncio.coroutine
+def stream_exception(request):
+    response = web.StreamResponse()
+    yield from response.prepare(request)
+    raise Exception('error')
+
+
+@asyncio.coroutine
+def stream_cancelled(request):
+    response = web.StreamResponse()
+    yield from response.prepare(request)
+    raise asyncio.CancelledError()
+
+
 @asyncio.coroutine
 def coro_2(request):
     tracer = get_tracer(request)
@@ -135,6 +159,10 @@ def setup_app(loop):
     app.router.add_get('/sub_span', route_sub_span)
     app.router.add_get('/uncaught_server_error', uncaught_server_error)
     app.router.add_get('/caught_server_error', caught_server_error)
+    app.router.add_get('/forbidden', forbidden)
+    app.router.add_get('/redirect', redirect)
+    app.router.add_get('/stream_exception', stream_exception)
+    app.router.add_get('/stream_cancelled', stream_cancelled)
     app.router.add_static('/statics', STATIC_DIR)
     # configure templates
     set_memory_loader(app)
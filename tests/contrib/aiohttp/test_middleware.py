@@ -1,11 +1,14 @@
 import asyncio
 
+import aiohttp
+import mock
 from aiohttp.test_utils import unittest_run_loop
 
+from ddtrace.contrib.aiohttp import middlewares
 from ddtrace.contrib.aiohttp.middlewares import trace_app, trace_middleware, CONFIG_KEY
 from ddtrace.ext import http
 from ddtrace.sampler import RateSampler
-from ddtrace.constants import SAMPLING_PRIORITY_KEY, ANALYTICS_SAMPLE_RATE_KEY
+from ddtrace.constants import SAMPLING_PRIORITY_KEY, ANALYTICS_SAMPLE_RATE_KEY, ORIGIN_KEY
 
 from opentracing.scope_managers.asyncio import AsyncioScopeManager
 from tests.opentracer.utils import init_tracer
@@ -218,6 +221,90 @@ class TestTraceMiddleware(TraceTestCase):
         assert trace_middleware == app.middlewares[0]
         assert noop_middleware == app.middlewares[1]
 
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_http_exception(self):
+        # web exceptions raised by the handler are the response
+        request = yield from self.client.request("GET", "/forbidden")
+        assert 403 == request.status
+        yield from request.text()
+
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        assert "GET /forbidden" == span.resource
+        assert "GET" == span.get_tag("http.method")
+        assert_span_http_status_code(span, 403)
+        assert 0 == span.error
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_http_exception_redirect(self):
+        request = yield from self.client.request("GET", "/redirect", allow_redirects=False)
+        assert 302 == request.status
+        yield from request.text()
+
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        assert "GET /redirect" == span.resource
+        assert_span_http_status_code(span, 302)
+        # a redirect is not an error
+        assert 0 == span.error
+
+    @asyncio.coroutine
+    def _test_prepared_stream_failure(self, url):
+        request = yield from self.client.request("GET", url)
+        assert 200 == request.status
+        try:
+            yield from request.read()
+        except aiohttp.ClientError:
+            # the connection is closed once the handler fails
+            pass
+
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        # the status sent to the client is kept
+        assert "GET " + url == span.resource
+        assert_span_http_status_code(span, 200)
+        return span
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_prepared_stream_exception(self):
+        span = yield from self._test_prepared_stream_failure("/stream_exception")
+        # the failure is still reported
+        assert 1 == span.error
+        assert "error" == span.get_tag("error.msg")
+        assert "Exception: error" in span.get_tag("error.stack")
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_prepared_stream_cancelled(self):
+        span = yield from self._test_prepared_stream_failure("/stream_cancelled")
+        assert 0 == span.error
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_static_handler_not_modified(self):
+        # the status is changed when the file response is prepared
+        headers = {"If-Modified-Since": "Fri, 31 Dec 2100 00:00:00 GMT"}
+        request = yield from self.client.request("GET", "/statics/empty.txt", headers=headers)
+        assert 304 == request.status
+        yield from request.read()
+
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        assert "GET /statics" == span.resource
+        assert_span_http_status_code(span, 304)
+        assert 0 == span.error
+
     @unittest_run_loop
     @asyncio.coroutine
     def test_exception(self):
@@ -293,6 +380,77 @@ class TestTraceMiddleware(TraceTestCase):
         assert span.parent_id == 42
         assert span.get_metric(SAMPLING_PRIORITY_KEY) is None
 
+    @asyncio.coroutine
+    def _test_distributed_tracing_headers(self, tracing_headers):
+        request = yield from self.client.request("GET", "/", headers=tracing_headers)
+        assert 200 == request.status
+        yield from request.text()
+        # the trace is created
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        # with the right trace_id and parent_id
+        assert 100 == span.trace_id
+        assert 42 == span.parent_id
+
+    @unittest_run_loop
+    def test_distributed_tracing_mixed_case_headers(self):
+        return self._test_distributed_tracing_headers({
+            "X-Datadog-Trace-Id": "100",
+            "X-DATADOG-PARENT-ID": "42",
+        })
+
+    @unittest_run_loop
+    def test_distributed_tracing_wsgi_headers(self):
+        return self._test_distributed_tracing_headers({
+            "HTTP_X_DATADOG_TRACE_ID": "100",
+            "HTTP_X_DATADOG_PARENT_ID": "42",
+        })
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_distributed_tracing_without_trace_id(self):
+        # without a trace id, the other propagation headers are not extracted
+        tracing_headers = {
+            "x-datadog-sampling-priority": "2",
+            "x-datadog-origin": "synthetics",
+        }
+
+        with mock.patch.object(middlewares.propagator, "extract") as extract:
+            request = yield from self.client.request("GET", "/", headers=tracing_headers)
+            assert 200 == request.status
+            yield from request.text()
+        assert not extract.called
+        # a new trace is started
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        assert 1 == len(traces[0])
+        span = traces[0][0]
+        assert span.parent_id is None
+        assert span.get_tag(ORIGIN_KEY) is None
+        assert 2 != span.get_metric(SAMPLING_PRIORITY_KEY)
+
+    @unittest_run_loop
+    @asyncio.coroutine
+    def test_distributed_tracing_disabled_skips_extract(self):
+        self.app["datadog_trace"]["distributed_tracing_enabled"] = False
+        tracing_headers = {
+            "x-datadog-trace-id": "100",
+            "x-datadog-parent-id": "42",
+        }
+
+        with mock.patch.object(middlewares.propagator, "extract") as extract:
+            request = yield from self.client.request("GET", "/", headers=tracing_headers)
+            assert 200 == request.status
+            yield from request.text()
+        assert not extract.called
+        traces = self.tracer.writer.pop_traces()
+        assert 1 == len(traces)
+        span = traces[0][0]
+        assert span.trace_id != 100
+        assert span.parent_id is None
+
     @unittest_run_loop
     @asyncio.coroutine
     def test_distributed_tracing_with_sampling_true(self):